@@ -1,17 +1,205 @@
-import json
-from typing import Optional
+import asyncio
+import functools
+import html
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Optional, TypeVar
 from urllib.parse import parse_qs, urlparse
-from urllib.request import urlopen
 
-from flask import Flask, render_template, request
-from openai import OpenAI
-from youtube_transcript_api import (NoTranscriptFound,
-                                    TranscriptsDisabled,
-                                    YouTubeTranscriptApi)
+import aiohttp
+import httpx
+import orjson
+import tiktoken
+from cachetools import TTLCache
+from jinja2 import Template
+from lxml import etree
+from openai import AsyncOpenAI, AsyncStream, DefaultAsyncHttpxClient
+from openai.types.chat import ChatCompletionChunk
+from quart import Quart, request, stream_template
+from yarl import URL
 
 
-app = Flask(__name__)
-client = OpenAI()
+app = Quart(__name__)
+# One client per worker, so completions reuse pooled HTTP/2 connections. The
+# SDK's default client keeps its timeout and redirect settings; only the pool
+# changes.
+openai_http = DefaultAsyncHttpxClient(
+    http2=True,
+    limits=httpx.Limits(
+        max_connections=64, max_keepalive_connections=64, keepalive_expiry=60
+    ),
+)
+client = AsyncOpenAI(http_client=openai_http)
+
+MODEL = "gpt-4o-mini"
+# Largest transcript, or set of partial notes, sent in a single prompt. It
+# leaves room in the context window for the instructions and the notes.
+MAX_PROMPT_TOKENS = 100_000
+# Transcripts over MAX_PROMPT_TOKENS are summarized in chunks of this size first.
+CHUNK_TOKENS = 3000
+# How many of one request's chunks are summarized at the same time.
+MAX_PARALLEL_CHUNKS = 4
+
+OPENAI_ERROR_MESSAGE = "We had trouble connecting to OpenAI. Please try again."
+
+_ENCODING = tiktoken.encoding_for_model(MODEL)
+
+# Only the transcript changes between requests, so the rest of each prompt is
+# built once here.
+_NOTES_MESSAGES = (
+    {
+        "role": "system",
+        "content": (
+            "You are an expert note taker. Create clear, well-structured notes with "
+            "concise headings, bullet points, and highlight the key takeaways."
+        ),
+    },
+)
+_NOTES_PROMPT_PREFIX = (
+    "Create structured notes for the following transcript. The notes should "
+    "include informative section headings, nested bullet points when "
+    "appropriate, and an overall summary at the end.\n\n"
+    "Transcript:\n"
+)
+_COMBINED_NOTES_PROMPT_PREFIX = (
+    "Create structured notes from the following notes, which cover "
+    "consecutive parts of one transcript. The notes should include "
+    "informative section headings, nested bullet points when "
+    "appropriate, and an overall summary at the end.\n\n"
+    "Partial notes:\n"
+)
+_CHUNK_MESSAGES = (
+    {
+        "role": "system",
+        "content": (
+            "You are an expert note taker. You will be given one part of a longer "
+            "transcript. Capture every important point it makes as concise bullet points."
+        ),
+    },
+)
+_CHUNK_PROMPT_PREFIX = "Transcript part:\n"
+
+_VIDEO_ID_RE = re.compile(r"[A-Za-z0-9_-]{11}")
+_WATCH_PREFIX = "https://www.youtube.com/watch?v="
+
+# Captions are looked up through the same innertube player API, and with the
+# same client, as youtube-transcript-api; the watch page only supplies the key.
+_INNERTUBE_API_KEY_RE = re.compile(r'"INNERTUBE_API_KEY":\s*"([a-zA-Z0-9_-]+)"')
+_INNERTUBE_CONTEXT = {"client": {"clientName": "ANDROID", "clientVersion": "20.10.38"}}
+_CONSENT_FORM = 'action="https://consent.youtube.com/s"'
+_CONSENT_VALUE_RE = re.compile(r'name="v" value="(.*?)"')
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+class TranscriptsDisabled(Exception):
+    """Raised when the video has no caption tracks at all."""
+
+
+class NoTranscriptFound(Exception):
+    """Raised when the video has caption tracks, but none in English."""
+
+
+class VideoUnavailable(Exception):
+    """Raised when YouTube reports the video as unavailable or unplayable."""
+
+
+class TranscriptFetchError(Exception):
+    """Raised when YouTube blocks the caption request or answers unexpectedly."""
+
+
+T = TypeVar("T")
+
+
+def async_ttl_cache(
+    maxsize: int, ttl: float
+) -> Callable[[Callable[[str], Coroutine[Any, Any, T]]], Callable[[str], Awaitable[T]]]:
+    """Memoize a single-argument coroutine function for ``ttl`` seconds.
+
+    Concurrent misses for the same key share one in-flight call, so only one
+    of them does the actual work; if it fails, they all see that failure.
+    ``None`` results are treated as failures and are not cached.
+    """
+
+    def decorator(
+        func: Callable[[str], Coroutine[Any, Any, T]]
+    ) -> Callable[[str], Awaitable[T]]:
+        cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        in_flight: dict[str, asyncio.Task] = {}
+
+        def finish(key: str, task: asyncio.Task) -> None:
+            del in_flight[key]
+            # Checking exception() also marks it retrieved if every caller left.
+            if not task.cancelled() and task.exception() is None:
+                if task.result() is not None:
+                    cache[key] = task.result()
+
+        @functools.wraps(func)
+        async def wrapper(key: str) -> T:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+            task = in_flight.get(key)
+            if task is None:
+                task = asyncio.create_task(func(key))
+                in_flight[key] = task
+                task.add_done_callback(functools.partial(finish, key))
+
+            # One caller going away must not cancel the fetch for the others.
+            return await asyncio.shield(task)
+
+        return wrapper
+
+    return decorator
+
+
+async def warm_connections() -> None:
+    """Connect to YouTube and OpenAI before the first request needs them.
+
+    A HEAD request through each real client fills aiohttp's DNS cache and both
+    keep-alive pools. This is best effort: failed or slow requests are ignored.
+    """
+
+    async def head_youtube() -> None:
+        async with app.http_session.head("https://www.youtube.com/"):
+            pass
+
+    try:
+        async with asyncio.timeout(3):
+            await asyncio.gather(
+                head_youtube(),
+                openai_http.head(str(client.base_url)),
+                return_exceptions=True,
+            )
+    except TimeoutError:
+        pass
+
+
+@app.before_serving
+async def open_http_session() -> None:
+    """Create the HTTP session shared by every request in this worker."""
+    # Keep idle connections to YouTube open well past aiohttp's 15 second
+    # default so occasional requests still skip the TCP and TLS handshake.
+    app.http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=32,
+            resolver=aiohttp.AsyncResolver(),
+            ttl_dns_cache=600,
+            keepalive_timeout=60,
+        ),
+        headers={"Accept-Language": "en-US"},
+    )
+    # Warm up in the background so the worker never waits on the network
+    # before it starts serving.
+    app.warmup_task = asyncio.create_task(warm_connections())
+
+
+@app.after_serving
+async def close_http_session() -> None:
+    app.warmup_task.cancel()
+    await asyncio.gather(app.warmup_task, return_exceptions=True)
+    await app.http_session.close()
+    await client.close()
 
 
 def extract_video_id(url: str) -> Optional[str]:
@@ -19,125 +207,369 @@ def extract_video_id(url: str) -> Optional[str]:
     if not url:
         return None
 
-    parsed = urlparse(url.strip())
+    url = url.strip()
+
+    # Most submissions are plain watch URLs, which need no parsing at all.
+    if url.startswith(_WATCH_PREFIX):
+        end = len(_WATCH_PREFIX) + 11
+        candidate = url[len(_WATCH_PREFIX):end]
+        if url[end:end + 1] in ("", "&", "#") and _VIDEO_ID_RE.fullmatch(candidate):
+            return candidate
+
+    parsed = urlparse(url)
+    candidate = None
 
-    if parsed.netloc in {"youtu.be"} and parsed.path:
-        return parsed.path.lstrip("/").split("/")[0]
+    if parsed.netloc == "youtu.be" and parsed.path:
+        candidate = parsed.path.lstrip("/").split("/")[0]
 
-    if "youtube" in parsed.netloc:
+    elif "youtube" in parsed.netloc:
         if parsed.path == "/watch":
-            return parse_qs(parsed.query).get("v", [None])[0]
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
 
-        if parsed.path.startswith("/shorts/"):
-            return parsed.path.split("/shorts/")[-1].split("/")[0]
+        elif parsed.path.startswith("/shorts/"):
+            candidate = parsed.path.split("/shorts/")[-1].split("/")[0]
 
-        if parsed.path.startswith("/embed/"):
-            return parsed.path.split("/embed/")[-1].split("/")[0]
+        elif parsed.path.startswith("/embed/"):
+            candidate = parsed.path.split("/embed/")[-1].split("/")[0]
+
+    if candidate and _VIDEO_ID_RE.fullmatch(candidate):
+        return candidate
 
     return None
 
 
-def fetch_video_title(video_id: str) -> Optional[str]:
+@async_ttl_cache(maxsize=4096, ttl=3600)
+async def fetch_video_title(video_id: str) -> Optional[str]:
     """Fetch the video title via YouTube's oEmbed endpoint."""
     video_url = f"https://www.youtube.com/watch?v={video_id}"
     oembed_url = f"https://www.youtube.com/oembed?url={video_url}&format=json"
 
     try:
-        with urlopen(oembed_url) as response:  # noqa: S310 (trusted domain)
-            return json.load(response).get("title")
+        async with app.http_session.get(oembed_url) as response:
+            response.raise_for_status()
+            return orjson.loads(await response.read()).get("title")
     except Exception:
         return None
 
 
-def build_notes(transcript_text: str) -> str:
-    system_prompt = (
-        "You are an expert note taker. Create clear, well-structured notes with "
-        "concise headings, bullet points, and highlight the key takeaways."
-    )
-    user_prompt = (
-        "Create structured notes for the following transcript. The notes should "
-        "include informative section headings, nested bullet points when "
-        "appropriate, and an overall summary at the end.\n\n"
-        f"Transcript:\n{transcript_text}"
+async def fetch_watch_page(video_id: str) -> str:
+    """Return the watch page HTML, accepting YouTube's cookie consent if asked."""
+    session = app.http_session
+
+    for _ in range(2):
+        async with session.get(f"https://www.youtube.com/watch?v={video_id}") as response:
+            response.raise_for_status()
+            watch_html = html.unescape(await response.text())
+
+        if _CONSENT_FORM not in watch_html:
+            return watch_html
+
+        match = _CONSENT_VALUE_RE.search(watch_html)
+        if match is None:
+            break
+        session.cookie_jar.update_cookies(
+            {"CONSENT": "YES+" + match.group(1)}, URL("https://www.youtube.com/")
+        )
+
+    raise TranscriptFetchError(f"{video_id}: could not get past the cookie consent page")
+
+
+def check_playability(playability: dict, video_id: str) -> None:
+    """Turn a non-OK ``playabilityStatus`` from the player API into an error."""
+    status = playability.get("status")
+    if status in (None, "OK"):
+        return
+
+    reason = playability.get("reason") or status
+    if status == "LOGIN_REQUIRED" and "not a bot" in reason:
+        raise TranscriptFetchError(f"{video_id}: YouTube is blocking requests ({reason})")
+    raise VideoUnavailable(f"{video_id}: {reason}")
+
+
+async def fetch_transcript(video_id: str) -> list[dict]:
+    """Fetch the English caption track of the video as a list of segments."""
+    session = app.http_session
+    watch_html = await fetch_watch_page(video_id)
+
+    match = _INNERTUBE_API_KEY_RE.search(watch_html)
+    if match is None:
+        if 'class="g-recaptcha"' in watch_html:
+            raise TranscriptFetchError(f"{video_id}: YouTube is asking for a captcha")
+        raise TranscriptFetchError(f"{video_id}: no innertube API key on the watch page")
+
+    async with session.post(
+        f"https://www.youtube.com/youtubei/v1/player?key={match.group(1)}",
+        json={"context": _INNERTUBE_CONTEXT, "videoId": video_id},
+    ) as response:
+        response.raise_for_status()
+        player = orjson.loads(await response.read())
+
+    check_playability(player.get("playabilityStatus", {}), video_id)
+
+    captions = player.get("captions", {}).get("playerCaptionsTracklistRenderer")
+    if not captions or not captions.get("captionTracks"):
+        raise TranscriptsDisabled(video_id)
+
+    # Prefer manually created captions over auto-generated ("asr") ones.
+    english = sorted(
+        (track for track in captions["captionTracks"] if track.get("languageCode") == "en"),
+        key=lambda track: track.get("kind") == "asr",
     )
+    if not english:
+        raise NoTranscriptFound(video_id)
+
+    base_url = english[0]["baseUrl"].replace("&fmt=srv3", "")
+    # These caption URLs only answer when given a proof-of-origin token.
+    if "&exp=xpe" in base_url:
+        raise TranscriptFetchError(f"{video_id}: the caption track requires a PO token")
+
+    async with session.get(base_url) as response:
+        response.raise_for_status()
+        body = await response.read()
+
+    if not body.strip():
+        raise TranscriptFetchError(f"{video_id}: YouTube returned an empty caption track")
+    root = etree.fromstring(body)
+
+    return [
+        {
+            "text": html.unescape(element.text),
+            "start": float(element.get("start", "0")),
+            "duration": float(element.get("dur", "0")),
+        }
+        for element in root.iter("text")
+        if element.text is not None
+    ]
+
+
+@async_ttl_cache(maxsize=256, ttl=3600)
+async def fetch_transcript_text(video_id: str) -> str:
+    """Return the English transcript of the video as a single string."""
+    transcript = await fetch_transcript(video_id)
+
+    # fetch_transcript always sets "text"; strip each segment exactly once.
+    return " ".join([text for segment in transcript if (text := segment["text"].strip())])
+
+
+def split_transcript(transcript_text: str, max_tokens: int = CHUNK_TOKENS) -> list[str]:
+    """Split the transcript into chunks of at most ``max_tokens`` tokens.
+
+    Chunks break on sentence boundaries where the transcript has any.
+    """
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+
+    for sentence in _SENTENCE_END_RE.split(transcript_text):
+        # Transcripts are plain text, so "<|endoftext|>" and friends are just
+        # characters here rather than special tokens.
+        tokens = _ENCODING.encode_ordinary(sentence)
+
+        # Auto-generated captions are often unpunctuated, so one "sentence"
+        # can be longer than a whole chunk. Cut whole chunks off its front by
+        # offset, then decode the leftover tail once.
+        start = 0
+        while len(tokens) - start > max_tokens:
+            if current:
+                chunks.append(" ".join(current))
+                current, current_tokens = [], 0
+            chunks.append(_ENCODING.decode(tokens[start:start + max_tokens]))
+            start += max_tokens
+        if start:
+            tokens = tokens[start:]
+            sentence = _ENCODING.decode(tokens)
+
+        if current and current_tokens + len(tokens) > max_tokens:
+            chunks.append(" ".join(current))
+            current, current_tokens = [], 0
+
+        if sentence:
+            current.append(sentence)
+            current_tokens += len(tokens)
+
+    if current:
+        chunks.append(" ".join(current))
+
+    return chunks
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` at the exact token boundary if it exceeds ``max_tokens``."""
+    tokens = _ENCODING.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return _ENCODING.decode(tokens[:max_tokens])
+
+
+async def summarize_chunk(chunk: str, limit: asyncio.Semaphore) -> str:
+    """Condense one part of a long transcript into detailed bullet points."""
+    async with limit:
+        response = await client.chat.completions.create(
+            model=MODEL,
+            messages=[*_CHUNK_MESSAGES, {"role": "user", "content": _CHUNK_PROMPT_PREFIX + chunk}],
+            temperature=0.3,
+        )
+
+    return response.choices[0].message.content.strip()
+
+
+async def build_notes(transcript_text: str) -> AsyncStream[ChatCompletionChunk]:
+    """Start generating notes and return the streamed completion.
+
+    Transcripts too long for one prompt are condensed chunk by chunk in
+    parallel, and the final, streamed pass works from those partial notes.
+    Failing to reach OpenAI raises ``RuntimeError`` here, before anything has
+    been sent to the browser.
+    """
+    # Tokenizing a long transcript takes tens of milliseconds, so keep it off
+    # the event loop. Its errors are not OpenAI errors, so leave them alone.
+    tokens = await asyncio.to_thread(_ENCODING.encode_ordinary, transcript_text)
+
+    # A single call streams its first token soonest, so only transcripts that
+    # would overflow it are condensed chunk by chunk first.
+    if len(tokens) > MAX_PROMPT_TOKENS:
+        chunks = await asyncio.to_thread(split_transcript, transcript_text)
+        # Long videos have dozens of chunks; sending them all at once mostly
+        # buys rate-limit errors.
+        limit = asyncio.Semaphore(MAX_PARALLEL_CHUNKS)
+        try:
+            # Unlike gather, a TaskGroup cancels the remaining chunks as soon
+            # as one fails, so no billed completions run for a failed request.
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(summarize_chunk(chunk, limit)) for chunk in chunks]
+        except ExceptionGroup as errors:
+            raise RuntimeError(OPENAI_ERROR_MESSAGE) from errors.exceptions[0]
+        partial_notes = [task.result() for task in tasks]
+
+        combined = await asyncio.to_thread(
+            truncate_to_tokens, "\n\n".join(partial_notes), MAX_PROMPT_TOKENS
+        )
+        user_prompt = _COMBINED_NOTES_PROMPT_PREFIX + combined
+    else:
+        user_prompt = _NOTES_PROMPT_PREFIX + transcript_text
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
+        stream = await client.chat.completions.create(
+            model=MODEL,
+            messages=[*_NOTES_MESSAGES, {"role": "user", "content": user_prompt}],
             temperature=0.3,
+            stream=True,
         )
     except Exception as exc:
-        raise RuntimeError("We had trouble connecting to OpenAI. Please try again.") from exc
+        raise RuntimeError(OPENAI_ERROR_MESSAGE) from exc
 
-    return response.choices[0].message.content.strip()
+    return stream
+
+
+async def stream_notes(stream: AsyncStream[ChatCompletionChunk]) -> AsyncIterator[str]:
+    """Yield the text of a streamed completion, minus any leading whitespace.
+
+    The completion is closed however iteration ends, including when the
+    browser disconnects and the generator is closed early.
+    """
+    started = False
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not started and text:
+                text = text.lstrip()
+            if text:
+                started = True
+                yield text
+    except Exception:
+        # Headers are already sent, so the best we can do is say so inline.
+        yield "\n\n[The notes were cut short because the connection to OpenAI dropped.]"
+    finally:
+        await stream.close()
+
+
+# Loaded once, so responses skip the template lookup and its freshness check.
+_FORM_TEMPLATE = app.jinja_env.get_template("index.html")
+_RESULT_TEMPLATE = app.jinja_env.get_template("result.html")
+
+
+async def render(template: Template, **context) -> str:
+    """Render a preloaded template with the usual Quart template context."""
+    await app.update_template_context(context)
+    return await template.render_async(context)
+
+
+async def render_error(message: str, previous_url: str) -> str:
+    """Render the form again with an error message and the submitted URL."""
+    return await render(_FORM_TEMPLATE, error=message, previous_url=previous_url)
 
 
 @app.route("/", methods=["GET"])
-def index():
-    return render_template("index.html")
+async def index():
+    return await render(_FORM_TEMPLATE)
 
 
 @app.route("/summarize", methods=["POST"])
-def summarize():
-    video_url = request.form.get("video_url", "").strip()
+async def summarize():
+    form = await request.form
+    video_url = form.get("video_url", "").strip()
 
     video_id = extract_video_id(video_url)
     if not video_id:
-        return render_template(
-            "index.html",
-            error="Please provide a valid YouTube URL (watch, shorts, or youtu.be).",
-            previous_url=video_url,
+        return await render_error(
+            "Please provide a valid YouTube URL (watch, shorts, or youtu.be).",
+            video_url,
         )
 
+    # The title is only needed for the result page, so look it up alongside
+    # the transcript fetch and the OpenAI call rather than after them.
+    title_task = asyncio.create_task(fetch_video_title(video_id))
     try:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=["en"])
-    except TranscriptsDisabled:
-        return render_template(
-            "index.html",
-            error="This video has transcripts disabled. Please try another video.",
-            previous_url=video_url,
-        )
-    except NoTranscriptFound:
-        return render_template(
-            "index.html",
-            error="No English transcript is available for this video.",
-            previous_url=video_url,
-        )
-    except Exception:
-        return render_template(
-            "index.html",
-            error="We couldn't fetch the transcript. Double-check the URL and try again.",
-            previous_url=video_url,
-        )
+        try:
+            transcript_text = await fetch_transcript_text(video_id)
+        except TranscriptsDisabled:
+            return await render_error(
+                "This video has transcripts disabled. Please try another video.",
+                video_url,
+            )
+        except NoTranscriptFound:
+            return await render_error(
+                "No English transcript is available for this video.",
+                video_url,
+            )
+        except VideoUnavailable:
+            return await render_error(
+                "This video is unavailable, private, or age-restricted.",
+                video_url,
+            )
+        except Exception:
+            return await render_error(
+                "We couldn't fetch the transcript. Double-check the URL and try again.",
+                video_url,
+            )
 
-    transcript_text = " ".join(
-        segment["text"].strip()
-        for segment in transcript
-        if segment.get("text", "").strip()
-    ).strip()
-
-    if not transcript_text:
-        return render_template(
-            "index.html",
-            error="The transcript appears to be empty. Please try a different video.",
-            previous_url=video_url,
-        )
+        if not transcript_text:
+            return await render_error(
+                "The transcript appears to be empty. Please try a different video.",
+                video_url,
+            )
 
-    try:
-        notes = build_notes(transcript_text)
-    except RuntimeError as err:
-        return render_template("index.html", error=str(err), previous_url=video_url)
+        try:
+            stream = await build_notes(transcript_text)
+        except RuntimeError as err:
+            return await render_error(str(err), video_url)
+
+        try:
+            title = await title_task or "Unknown Title"
+        except BaseException:
+            # Nothing will read the completion now, so release its connection.
+            await stream.close()
+            raise
+    finally:
+        title_task.cancel()
 
-    title = fetch_video_title(video_id) or "Unknown Title"
     canonical_url = f"https://www.youtube.com/watch?v={video_id}"
 
-    return render_template(
-        "result.html",
-        notes=notes,
+    return await stream_template(
+        _RESULT_TEMPLATE,
+        notes=stream_notes(stream),
         video_title=title,
         video_url=canonical_url,
     )
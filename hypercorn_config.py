@@ -0,0 +1,17 @@
+"""Hypercorn settings for serving the notetaker in production.
+
+Run with ``hypercorn --config file:hypercorn_config.py app:app``.
+"""
+from os import cpu_count
+
+bind = ["0.0.0.0:5000"]
+
+# Each worker runs its own event loop, which already overlaps the YouTube and
+# OpenAI round-trips, so one worker per core is enough to use every core.
+workers = cpu_count() or 1
+worker_class = "asyncio"
+
+graceful_timeout = 30
+
+accesslog = "-"
+errorlog = "-"